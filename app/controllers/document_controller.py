@@ -1,25 +1,38 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException
 from typing import List
 from datetime import datetime
+import asyncio
 import logging
+import os
+import shutil
+import tempfile
 
 from app.models.schemas import DocumentUpload, DocumentInfo
-from app.core.dependencies import get_document_service
+from app.core.dependencies import get_document_service, get_embed_semaphore
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/documents", tags=["documents"])
 
+_ALLOWED_EXTS = frozenset({".pdf"})
+_UPLOAD_READ_SIZE = 1024 * 1024
+
 
 @router.post("/upload", response_model=DocumentUpload)
 async def upload_document(file: UploadFile = File(...)):
     """Upload a PDF document."""
-    if not file.filename.lower().endswith('.pdf'):
+    if os.path.splitext(file.filename or "")[1].lower() not in _ALLOWED_EXTS:
         raise HTTPException(status_code=400, detail="Only PDF files are supported")
     
+    # Copy the upload to disk in fixed-size reads so peak memory stays
+    # bounded regardless of the PDF's size; the copy runs off the event loop.
+    tmp = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
     try:
-        content = await file.read()
+        with tmp:
+            await asyncio.to_thread(shutil.copyfileobj, file.file, tmp, _UPLOAD_READ_SIZE)
+        
         service = get_document_service()
-        result = service.upload_document(file.filename, content)
+        async with get_embed_semaphore():
+            result = await service.upload_document(file.filename, tmp.name)
         
         return DocumentUpload(
             id=result["id"],
@@ -30,9 +43,10 @@ async def upload_document(file: UploadFile = File(...)):
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        import traceback
-        logger.error(f"Upload error: {traceback.format_exc()}")
+        logger.exception("Upload error")
         raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
+    finally:
+        os.unlink(tmp.name)
 
 
 @router.get("", response_model=List[DocumentInfo])
@@ -1,3 +1,5 @@
+from pathlib import Path
+
 from fastapi import APIRouter
 from fastapi.responses import HTMLResponse
 
@@ -5,12 +7,13 @@ from app.models.schemas import HealthResponse
 
 router = APIRouter(tags=["health"])
 
+_INDEX_HTML = Path("static/index.html").read_text(encoding="utf-8")
+
 
 @router.get("/", response_class=HTMLResponse)
 async def read_root():
     """Serve the main HTML page."""
-    with open("static/index.html", "r", encoding="utf-8") as f:
-        return f.read()
+    return _INDEX_HTML
 
 
 @router.get("/health", response_model=HealthResponse)
@@ -1,21 +1,47 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator
 import logging
 
+import orjson
+
 from app.models.schemas import QueryRequest, QueryResponse
 from app.core.dependencies import get_query_service
 
 logger = logging.getLogger(__name__)
 router = APIRouter(tags=["query"])
 
+_NDJSON = "application/x-ndjson"
+
 
 @router.post("/query", response_model=QueryResponse)
 async def query_documents(request: QueryRequest):
     """Query the RAG system."""
     try:
         service = get_query_service()
-        result = service.query(request.question, request.top_k)
+        result = await service.query(request.question, request.top_k)
         return QueryResponse(**result)
     except Exception as e:
-        import traceback
-        logger.error(f"Query error: {traceback.format_exc()}")
+        logger.exception("Query error")
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
+
+
+@router.post("/query/stream")
+async def stream_query_documents(request: QueryRequest, http_request: Request):
+    """Query the RAG system, streaming the answer as server-sent events or NDJSON."""
+    service = get_query_service()
+    events = service.stream_query(request.question, request.top_k)
+    if _NDJSON in http_request.headers.get("accept", ""):
+        return StreamingResponse(_encode_events(events, b"", b"\n"), media_type=_NDJSON)
+    return StreamingResponse(_encode_events(events, b"data: ", b"\n\n"), media_type="text/event-stream")
+
+
+async def _encode_events(events: AsyncIterator[dict], prefix: bytes, suffix: bytes) -> AsyncIterator[bytes]:
+    """Serialise query events as framed JSON, ending with an error event on failure."""
+    try:
+        async for event in events:
+            yield prefix + orjson.dumps(event) + suffix
+    except Exception as e:
+        logger.exception("Query stream error")
+        error = {"type": "error", "detail": f"Error processing query: {str(e)}"}
+        yield prefix + orjson.dumps(error) + suffix
@@ -13,11 +13,40 @@ class Settings:
     
     CHROMA_DB_PATH: str = "./chroma_db"
     CHROMA_COLLECTION_NAME: str = "documents"
+    # Vectors are stored normalised, so "ip" ranks like cosine without the
+    # per-comparison norms; only applies to newly created collections
+    HNSW_SPACE: str = os.getenv("HNSW_SPACE", "ip")
+    HNSW_CONSTRUCTION_EF: int = int(os.getenv("HNSW_CONSTRUCTION_EF", "200"))
+    HNSW_SEARCH_EF: int = int(os.getenv("HNSW_SEARCH_EF", "100"))
+    HNSW_M: int = int(os.getenv("HNSW_M", "16"))
+    HNSW_BATCH_SIZE: int = int(os.getenv("HNSW_BATCH_SIZE", "500"))
+    HNSW_SYNC_THRESHOLD: int = int(os.getenv("HNSW_SYNC_THRESHOLD", "5000"))
+    METADATA_COMPACT_EVERY: int = 100
+    METADATA_FLUSH_DELAY_SECONDS: float = 1.0
+    
+    # Serve searches from an exact in-memory index instead of Chroma's HNSW
+    IN_MEMORY_INDEX: bool = os.getenv("IN_MEMORY_INDEX", "false").lower() == "true"
+    IN_MEMORY_INDEX_INT8: bool = os.getenv("IN_MEMORY_INDEX_INT8", "true").lower() == "true"
     
     CHUNK_SIZE: int = 1000
     CHUNK_OVERLAP: int = 200
     
+    PDF_WORKERS: int = min(8, os.cpu_count() or 1)
+    PDF_PARALLEL_MIN_PAGES: int = 32
+    
+    EMBED_BATCH_SIZE: int = 100
+    EMBED_CONCURRENCY: int = 8
+    MAX_CONCURRENT_UPLOADS: int = int(os.getenv("MAX_CONCURRENT_UPLOADS", "2"))
+    
+    QUERY_CACHE_SIZE: int = 2000
+    QUERY_CACHE_TTL_SECONDS: int = 600
+    EMBEDDING_CACHE_SIZE: int = 4096
+    CHUNK_EMBEDDING_CACHE_SIZE: int = 5000
+    ANSWER_CACHE_SIZE: int = 500
+    ANSWER_CACHE_SIMILARITY: float = 0.95
+    
     PROMPT_TEMPLATE_PATH: str = "prompts/base_prompt.txt"
+    JINJA_CACHE_DIR: str = "./.jinja_cache"
     
     @classmethod
     def validate(cls):
@@ -1,33 +1,88 @@
 """Dependency injection for services."""
 
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from app.core.config import settings
 from app.repositories.document_repository import DocumentRepository
 from app.services.document_service import DocumentService
+from app.services.pdf_extraction import warm_up
 from app.services.query_service import QueryService
 
 # Singleton instances
 _document_repository = None
 _document_service = None
 _query_service = None
+_pdf_executor = None
+_lock = threading.RLock()
+
+# Bounds how many uploads embed and index at once; each upload already fans
+# out to EMBED_CONCURRENCY Gemini calls and writes into the same collection.
+_embed_semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_UPLOADS)
 
 
 def get_document_repository() -> DocumentRepository:
     global _document_repository
     if _document_repository is None:
-        _document_repository = DocumentRepository()
+        with _lock:
+            if _document_repository is None:
+                _document_repository = DocumentRepository()
     return _document_repository
 
 
 def get_document_service() -> DocumentService:
     global _document_service
     if _document_service is None:
-        repo = get_document_repository()
-        _document_service = DocumentService(repo)
+        with _lock:
+            if _document_service is None:
+                repo = get_document_repository()
+                _document_service = DocumentService(repo, get_pdf_executor())
     return _document_service
 
 
 def get_query_service() -> QueryService:
     global _query_service
     if _query_service is None:
-        repo = get_document_repository()
-        _query_service = QueryService(repo)
+        with _lock:
+            if _query_service is None:
+                repo = get_document_repository()
+                _query_service = QueryService(repo)
     return _query_service
+
+
+def get_embed_semaphore() -> asyncio.Semaphore:
+    return _embed_semaphore
+
+
+def get_pdf_executor() -> Optional[ProcessPoolExecutor]:
+    """Process pool for PDF text extraction, or None when extraction runs inline."""
+    global _pdf_executor
+    if _pdf_executor is None and settings.PDF_WORKERS > 1:
+        with _lock:
+            if _pdf_executor is None:
+                # Spawned workers start clean instead of forking a process that
+                # already runs gRPC, Chroma and server threads.
+                _pdf_executor = ProcessPoolExecutor(
+                    max_workers=settings.PDF_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _pdf_executor
+
+
+def warm_pdf_executor():
+    """Start every PDF worker process ahead of the first upload."""
+    executor = get_pdf_executor()
+    if executor is not None:
+        for future in [executor.submit(warm_up) for _ in range(settings.PDF_WORKERS)]:
+            future.result()
+
+
+def shutdown_pdf_executor():
+    global _pdf_executor
+    with _lock:
+        if _pdf_executor is not None:
+            _pdf_executor.shutdown(cancel_futures=True)
+            _pdf_executor = None
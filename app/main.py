@@ -1,14 +1,39 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 
 from app.controllers.document_controller import router as document_router
 from app.controllers.query_controller import router as query_router
 from app.controllers.health_controller import router as health_router
+from app.core.dependencies import (
+    get_document_repository,
+    get_document_service,
+    get_query_service,
+    shutdown_pdf_executor,
+    warm_pdf_executor
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build the service singletons at boot so no request pays the cold start."""
+    await asyncio.to_thread(get_document_service)
+    await asyncio.to_thread(get_query_service)
+    await asyncio.to_thread(warm_pdf_executor)
+    yield
+    await asyncio.to_thread(get_document_repository().flush_metadata)
+    await asyncio.to_thread(shutdown_pdf_executor)
+
 
 app = FastAPI(
     title="DocMind RAG System",
     description="A RAG system using Google Gemini and ChromaDB",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Mount static files
@@ -1,14 +1,42 @@
 import os
-import json
+import atexit
+import asyncio
+import hashlib
 import logging
-from typing import List, Optional
+import threading
+from collections import OrderedDict
+from typing import Hashable, List, Optional
 import chromadb
+import numpy as np
+import orjson
 import google.generativeai as genai
+from chromadb.utils.batch_utils import create_batches
 
 from app.core.config import settings
+from app.repositories.embedding_index import EmbeddingIndex
 
 logger = logging.getLogger(__name__)
 
+# One Chroma client per process: opening it loads SQLite and the HNSW
+# segments, so every repository instance shares it.
+_client = None
+_client_lock = threading.Lock()
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = chromadb.PersistentClient(path=settings.CHROMA_DB_PATH)
+    return _client
+
+
+def _normalize(vector) -> np.ndarray:
+    """Return a unit-length float32 copy of vector."""
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
 
 class DocumentRepository:
     """Data access layer for document storage and retrieval using ChromaDB."""
@@ -18,42 +46,135 @@ class DocumentRepository:
         
         genai.configure(api_key=settings.GEMINI_API_KEY)
         self.embed_model = settings.EMBEDDING_MODEL_NAME
+        self._embedding_cache: OrderedDict = OrderedDict()
+        self._chunk_embedding_cache: OrderedDict = OrderedDict()
+        self._embedding_cache_lock = threading.RLock()
         
-        self.chroma_client = chromadb.PersistentClient(path=settings.CHROMA_DB_PATH)
-        self.collection = self.chroma_client.get_or_create_collection(
-            name=settings.CHROMA_COLLECTION_NAME,
-            metadata={"hnsw:space": "cosine"}
-        )
+        self.chroma_client = _get_client()
+        self.collection = self._get_or_create_collection()
+        
+        self.index = None
+        if settings.IN_MEMORY_INDEX:
+            self.index = EmbeddingIndex(quantize=settings.IN_MEMORY_INDEX_INT8)
+            self._load_index()
         
         self.documents = {}
+        self._doc_ids_by_hash = {}
+        # Bumped on every write so readers can tell when cached results are stale
+        self.revision = 0
+        self._metadata_lock = threading.RLock()
+        self._pending_records: List[bytes] = []
+        self._flush_timer: Optional[threading.Timer] = None
         self._load_metadata()
+        atexit.register(self.flush_metadata)
     
-    def get_embedding(self, text: str, task_type: str = "retrieval_document") -> List[float]:
-        """Generate embedding for text using Gemini."""
-        result = genai.embed_content(
+    async def get_embedding_async(self, text: str, task_type: str = "retrieval_document") -> List[float]:
+        """Generate embedding for text using Gemini, reusing recently computed vectors."""
+        key = (task_type, text)
+        cached = self._lru_get(self._embedding_cache, key)
+        if cached is not None:
+            return list(cached)
+        
+        result = await genai.embed_content_async(
             model=self.embed_model,
             content=text,
             task_type=task_type
         )
+        # Stored as a tuple so callers can never mutate a cached vector
+        self._lru_put(
+            self._embedding_cache, key, tuple(result['embedding']), settings.EMBEDDING_CACHE_SIZE
+        )
         return result['embedding']
     
-    def add_chunks(self, doc_id: str, filename: str, chunks: List[str]) -> int:
+    async def get_embeddings_batch_async(
+        self, texts: List[str], task_type: str = "retrieval_document"
+    ) -> List[List[float]]:
+        """Generate embeddings for several texts with a single Gemini request."""
+        result = await genai.embed_content_async(
+            model=self.embed_model,
+            content=texts,
+            task_type=task_type
+        )
+        return result['embedding']
+    
+    async def add_chunks(self, doc_id: str, filename: str, chunks: List[str]) -> int:
         """Store document chunks with embeddings in ChromaDB."""
-        for i, chunk in enumerate(chunks):
-            chunk_id = f"{doc_id}_{i}"
-            embedding = self.get_embedding(chunk)
-            
-            self.collection.add(
-                ids=[chunk_id],
-                embeddings=[embedding],
-                documents=[chunk],
-                metadatas=[{"doc_id": doc_id, "filename": filename, "chunk_index": i}]
+        if not chunks:
+            return 0
+        
+        # Repeated chunks (running headers, footers, boilerplate) and chunks
+        # seen in earlier uploads are embedded once and reused by hash.
+        keys = [hashlib.blake2b(chunk.encode(), digest_size=16).digest() for chunk in chunks]
+        vectors = {}
+        pending = {}
+        for key, chunk in zip(keys, chunks):
+            if key in vectors or key in pending:
+                continue
+            cached = self._lru_get(self._chunk_embedding_cache, key)
+            if cached is not None:
+                vectors[key] = cached
+            else:
+                pending[key] = chunk
+        
+        # Each Gemini request embeds a whole batch; up to EMBED_CONCURRENCY
+        # batches are in flight at once and gather() keeps them in order.
+        texts = list(pending.values())
+        batch_size = settings.EMBED_BATCH_SIZE
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        semaphore = asyncio.Semaphore(settings.EMBED_CONCURRENCY)
+        
+        async def embed(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                return await self.get_embeddings_batch_async(batch)
+        
+        results = await asyncio.gather(*(embed(batch) for batch in batches))
+        fresh = (embedding for batch in results for embedding in batch)
+        for key, embedding in zip(pending, fresh):
+            vectors[key] = _normalize(embedding)
+            self._lru_put(
+                self._chunk_embedding_cache, key, vectors[key], settings.CHUNK_EMBEDDING_CACHE_SIZE
             )
         
+        if len(pending) < len(chunks):
+            logger.info(f"Reused embeddings for {len(chunks) - len(pending)} of {len(chunks)} chunks")
+        embeddings = [vectors[key].tolist() for key in keys]
+        
+        await asyncio.to_thread(self._insert_chunks, doc_id, filename, chunks, embeddings)
         return len(chunks)
     
+    def _insert_chunks(
+        self, doc_id: str, filename: str, chunks: List[str], embeddings: List[List[float]]
+    ):
+        """Write embedded chunks to ChromaDB."""
+        # One add per batch; create_batches only splits when the document
+        # exceeds the client's maximum batch size.
+        for ids, batch_embeddings, metadatas, documents in create_batches(
+            api=self.chroma_client,
+            ids=[f"{doc_id}_{i}" for i in range(len(chunks))],
+            embeddings=embeddings,
+            metadatas=[
+                {"doc_id": doc_id, "filename": filename, "chunk_index": i}
+                for i in range(len(chunks))
+            ],
+            documents=chunks
+        ):
+            self.collection.add(
+                ids=ids,
+                embeddings=batch_embeddings,
+                metadatas=metadatas,
+                documents=documents
+            )
+            if self.index is not None:
+                self.index.add(ids, batch_embeddings, documents, metadatas)
+        self.revision += 1
+    
     def search(self, query_embedding: List[float], top_k: int = 3) -> dict:
         """Search for relevant chunks using embedding similarity."""
+        # Stored vectors are unit length, so inner product ranks like cosine
+        query_embedding = _normalize(query_embedding).tolist()
+        if self.index is not None:
+            return self.index.search(query_embedding, top_k)
+        
         results = self.collection.query(
             query_embeddings=[query_embedding],
             n_results=top_k
@@ -62,60 +183,216 @@ class DocumentRepository:
     
     def save_document_metadata(self, doc_id: str, metadata: dict):
         """Save document metadata."""
-        self.documents[doc_id] = metadata
-        self._save_metadata()
+        with self._metadata_lock:
+            self.documents[doc_id] = metadata
+            if metadata.get("content_hash"):
+                self._doc_ids_by_hash[metadata["content_hash"]] = doc_id
+            self._append_metadata({"op": "add", **metadata})
     
     def get_document(self, doc_id: str) -> Optional[dict]:
         """Get document metadata by ID."""
         return self.documents.get(doc_id)
     
+    def get_document_by_hash(self, content_hash: str) -> Optional[dict]:
+        """Get metadata of a previously uploaded document with identical content."""
+        doc_id = self._doc_ids_by_hash.get(content_hash)
+        return self.documents.get(doc_id) if doc_id else None
+    
     def get_all_documents(self) -> List[dict]:
         """Get all document metadata."""
-        return list(self.documents.values())
+        with self._metadata_lock:
+            return list(self.documents.values())
     
     def delete_document(self, doc_id: str) -> bool:
         """Delete a document and its chunks."""
         if doc_id not in self.documents:
             return False
         
-        results = self.collection.get(where={"doc_id": doc_id})
+        # Deleting by filter resolves the ids inside Chroma, so no chunk text
+        # or metadata is fetched just to find out what to remove.
+        self.collection.delete(where={"doc_id": doc_id})
+        if self.index is not None:
+            self.index.remove_document(doc_id)
         
-        if results['ids']:
-            self.collection.delete(ids=results['ids'])
-        
-        del self.documents[doc_id]
-        self._save_metadata()
+        with self._metadata_lock:
+            doc = self.documents.pop(doc_id, None)
+            if doc is None:
+                return False
+            if doc.get("content_hash"):
+                self._doc_ids_by_hash.pop(doc["content_hash"], None)
+            self.revision += 1
+            self._append_metadata({"op": "del", "id": doc_id})
         return True
     
     def delete_all(self) -> bool:
         """Delete all documents and reset the collection."""
         try:
             self.chroma_client.delete_collection(name=settings.CHROMA_COLLECTION_NAME)
-            self.collection = self.chroma_client.get_or_create_collection(
-                name=settings.CHROMA_COLLECTION_NAME,
-                metadata={"hnsw:space": "cosine"}
-            )
-            self.documents = {}
-            self._save_metadata()
+            self.collection = self._get_or_create_collection()
+            if self.index is not None:
+                self.index.clear()
+            with self._metadata_lock:
+                self.documents = {}
+                self._doc_ids_by_hash = {}
+                self.revision += 1
+                self._compact_metadata()
             return True
         except Exception as e:
             logger.error(f"Error deleting all documents: {e}")
             return False
     
-    def _save_metadata(self):
-        """Persist metadata to disk."""
-        metadata_file = os.path.join(settings.CHROMA_DB_PATH, "metadata.json")
+    def _lru_get(self, cache: OrderedDict, key: Hashable):
+        with self._embedding_cache_lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+    
+    def _lru_put(self, cache: OrderedDict, key: Hashable, value, max_size: int):
+        with self._embedding_cache_lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            if len(cache) > max_size:
+                cache.popitem(last=False)
+    
+    def _load_index(self):
+        """Populate the in-memory index from everything stored in ChromaDB."""
+        results = self.collection.get(include=["embeddings", "documents", "metadatas"])
+        self.index.add(results['ids'], results['embeddings'], results['documents'], results['metadatas'])
+        logger.info(f"Loaded {self.index.size} chunks into the in-memory index")
+    
+    def _get_or_create_collection(self):
+        """Open the documents collection, creating it with the configured HNSW parameters."""
+        # HNSW parameters are fixed when the index is built; passing them to
+        # get_or_create_collection would only rewrite the stored metadata of an
+        # existing collection so it no longer matches its index.
+        try:
+            return self.chroma_client.get_collection(name=settings.CHROMA_COLLECTION_NAME)
+        except ValueError:
+            pass
+        return self.chroma_client.create_collection(
+            name=settings.CHROMA_COLLECTION_NAME,
+            get_or_create=True,
+            metadata={
+                "hnsw:space": settings.HNSW_SPACE,
+                "hnsw:construction_ef": settings.HNSW_CONSTRUCTION_EF,
+                "hnsw:search_ef": settings.HNSW_SEARCH_EF,
+                "hnsw:M": settings.HNSW_M,
+                "hnsw:batch_size": settings.HNSW_BATCH_SIZE,
+                "hnsw:sync_threshold": settings.HNSW_SYNC_THRESHOLD
+            }
+        )
+    
+    def _append_metadata(self, record: dict):
+        """Queue one change for the metadata log and schedule a flush."""
+        with self._metadata_lock:
+            self._pending_records.append(orjson.dumps(record) + b"\n")
+            # Changes arriving within the delay share one write, so a batch
+            # ingest appends to the log once instead of once per document.
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(settings.METADATA_FLUSH_DELAY_SECONDS, self.flush_metadata)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+    
+    def flush_metadata(self):
+        """Write queued changes to the metadata log, compacting it periodically."""
+        with self._metadata_lock:
+            self._cancel_flush()
+            if not self._pending_records:
+                return
+            
+            os.makedirs(settings.CHROMA_DB_PATH, exist_ok=True)
+            with open(self._metadata_log_path(), 'ab') as f:
+                f.write(b"".join(self._pending_records))
+            
+            self._metadata_log_ops += len(self._pending_records)
+            self._pending_records = []
+            if self._metadata_log_ops >= settings.METADATA_COMPACT_EVERY:
+                self._compact_metadata()
+    
+    def _cancel_flush(self):
+        """Stop a scheduled flush that has not fired yet."""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+    
+    def _compact_metadata(self):
+        """Rewrite the metadata log as one add record per live document."""
+        with self._metadata_lock:
+            # The snapshot already reflects every queued change
+            self._cancel_flush()
+            self._pending_records = []
+            self._write_metadata_snapshot()
+    
+    def _write_metadata_snapshot(self):
+        """Atomically replace the metadata log with the current documents."""
+        with self._metadata_lock:
+            docs = list(self.documents.values())
+        
         os.makedirs(settings.CHROMA_DB_PATH, exist_ok=True)
-        with open(metadata_file, 'w') as f:
-            json.dump(self.documents, f)
+        log_file = self._metadata_log_path()
+        tmp_file = log_file + ".tmp"
+        with open(tmp_file, 'wb') as f:
+            for doc in docs:
+                f.write(orjson.dumps({"op": "add", **doc}) + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, log_file)
+        self._fsync_dir(settings.CHROMA_DB_PATH)
+        self._metadata_log_ops = 0
+    
+    def _fsync_dir(self, path: str):
+        """Flush a directory entry so a completed rename survives a crash."""
+        # Windows cannot open a directory handle to fsync
+        if os.name == "nt":
+            return
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
     
     def _load_metadata(self):
-        """Load metadata from disk."""
-        metadata_file = os.path.join(settings.CHROMA_DB_PATH, "metadata.json")
-        if os.path.exists(metadata_file):
-            try:
-                with open(metadata_file, 'r') as f:
-                    self.documents = json.load(f)
-            except Exception as e:
-                logger.error(f"Error loading metadata: {e}")
-                self.documents = {}
+        """Load metadata from disk by replaying the metadata log."""
+        self._metadata_log_ops = 0
+        log_file = self._metadata_log_path()
+        legacy_file = os.path.join(settings.CHROMA_DB_PATH, "metadata.json")
+        
+        try:
+            if os.path.exists(log_file):
+                torn = False
+                with open(log_file, 'rb') as f:
+                    for line in f:
+                        try:
+                            record = orjson.loads(line)
+                        except orjson.JSONDecodeError:
+                            # A crash mid-append leaves a partial record; skip
+                            # it rather than discarding the whole log.
+                            logger.warning("Skipping corrupt metadata log record")
+                            torn = True
+                            continue
+                        if record.pop("op") == "add":
+                            self.documents[record["id"]] = record
+                        else:
+                            self.documents.pop(record["id"], None)
+                        self._metadata_log_ops += 1
+                if torn:
+                    # Rewrite so later appends don't land after a partial line
+                    self._compact_metadata()
+            elif os.path.exists(legacy_file):
+                with open(legacy_file, 'rb') as f:
+                    self.documents = orjson.loads(f.read())
+                self._compact_metadata()
+                os.remove(legacy_file)
+        except Exception as e:
+            logger.error(f"Error loading metadata: {e}")
+            self.documents = {}
+        
+        self._doc_ids_by_hash = {
+            doc["content_hash"]: doc_id
+            for doc_id, doc in self.documents.items()
+            if doc.get("content_hash")
+        }
+    
+    def _metadata_log_path(self) -> str:
+        return os.path.join(settings.CHROMA_DB_PATH, "metadata.jsonl")
@@ -1,45 +1,63 @@
-import io
+import os
+import re
 import uuid
+import asyncio
+import hashlib
 import logging
+import threading
+from concurrent.futures import Executor
 from datetime import datetime
-from typing import List
-
-from pypdf import PdfReader
+from itertools import repeat
+from typing import List, Optional
 
 from app.core.config import settings
 from app.repositories.document_repository import DocumentRepository
+from app.services.pdf_extraction import count_pages, extract_page_range
 
 logger = logging.getLogger(__name__)
 
+_NON_WS = re.compile(r"\S").search
+
+# PyMuPDF is not thread-safe, so in-process extraction runs one file at a time
+_PDF_LOCK = threading.Lock()
+
 
 class DocumentService:
     """Business logic for document management."""
     
-    def __init__(self, repository: DocumentRepository):
+    def __init__(self, repository: DocumentRepository, pdf_executor: Optional[Executor] = None):
         self.repository = repository
+        self.pdf_executor = pdf_executor
     
-    def upload_document(self, filename: str, file_content: bytes) -> dict:
-        """Process and store a PDF document."""
+    async def upload_document(self, filename: str, file_path: str) -> dict:
+        """Process and store a PDF document read from file_path."""
+        content_hash = await asyncio.to_thread(self._hash_file, file_path)
+        existing = self.repository.get_document_by_hash(content_hash)
+        if existing:
+            logger.info(f"Skipping {filename}: identical to already indexed {existing['filename']}")
+            return existing
+        
         doc_id = str(uuid.uuid4())
         
-        logger.info(f"Processing file: {filename}, size: {len(file_content)} bytes")
+        logger.info(f"Processing file: {filename}, size: {os.path.getsize(file_path)} bytes")
         
-        text = self._extract_text_from_pdf(file_content)
+        text = await asyncio.to_thread(self._extract_text_from_pdf, file_path)
         logger.info(f"Extracted text length: {len(text)} characters")
         
-        if not text.strip():
+        if not _NON_WS(text):
             raise ValueError("Could not extract text from PDF")
         
         chunks = self._chunk_text(text)
         logger.info(f"Created {len(chunks)} chunks")
         
-        self.repository.add_chunks(doc_id, filename, chunks)
+        await self.repository.add_chunks(doc_id, filename, chunks)
         
         metadata = {
             "id": doc_id,
             "filename": filename,
             "uploaded_at": datetime.now().isoformat(),
-            "chunks_count": len(chunks)
+            "chunks_count": len(chunks),
+            "content_hash": content_hash
         }
         self.repository.save_document_metadata(doc_id, metadata)
         
@@ -57,23 +75,31 @@ class DocumentService:
         """Delete all documents."""
         return self.repository.delete_all()
     
-    def _extract_text_from_pdf(self, file_content: bytes) -> str:
-        """Extract text from PDF bytes."""
+    def _hash_file(self, file_path: str) -> str:
+        """Return the SHA-256 hex digest of a file's contents."""
+        with open(file_path, 'rb') as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+    
+    def _extract_text_from_pdf(self, file_path: str) -> str:
+        """Extract text from a PDF file."""
         try:
-            reader = PdfReader(io.BytesIO(file_content))
-            
-            if reader.is_encrypted:
-                raise ValueError("PDF is encrypted. Please provide an unencrypted PDF.")
-            
-            text = ""
-            for page_num, page in enumerate(reader.pages):
-                try:
-                    page_text = page.extract_text() or ""
-                    text += page_text
-                except Exception as e:
-                    logger.warning(f"Could not extract text from page {page_num + 1}: {e}")
+            if self.pdf_executor is None:
+                with _PDF_LOCK:
+                    text = extract_page_range(file_path, 0, count_pages(file_path))
+            else:
+                # All PyMuPDF calls run in the worker processes: it is not
+                # thread-safe and holds the GIL while extracting. Large documents
+                # are split into contiguous page ranges parsed in parallel.
+                page_count = self.pdf_executor.submit(count_pages, file_path).result()
+                workers = 1
+                if page_count >= settings.PDF_PARALLEL_MIN_PAGES:
+                    workers = min(settings.PDF_WORKERS, page_count)
+                step = max(1, -(-page_count // workers))
+                starts = range(0, page_count, step)
+                stops = [min(start + step, page_count) for start in starts]
+                text = "".join(self.pdf_executor.map(extract_page_range, repeat(file_path), starts, stops))
             
-            if not text.strip():
+            if not _NON_WS(text):
                 raise ValueError(
                     "Could not extract any text from the PDF. "
                     "This might be a scanned/image-based PDF."
@@ -90,12 +116,11 @@ class DocumentService:
         chunk_size = settings.CHUNK_SIZE
         overlap = settings.CHUNK_OVERLAP
         
-        chunks = []
-        start = 0
-        while start < len(text):
-            end = start + chunk_size
-            chunk = text[start:end]
-            if chunk.strip():
-                chunks.append(chunk)
-            start = end - overlap
-        return chunks
+        # A chunk starting within the final `overlap` characters would lie
+        # entirely inside its predecessor, so starts stop short of that tail.
+        last_start = max(len(text) - overlap, min(len(text), 1))
+        chunks = (
+            text[start:start + chunk_size]
+            for start in range(0, last_start, chunk_size - overlap)
+        )
+        return [chunk for chunk in chunks if not chunk.isspace()]
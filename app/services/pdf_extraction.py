@@ -0,0 +1,31 @@
+"""PDF text extraction; imported by worker processes, so it avoids app imports."""
+
+import logging
+
+import pymupdf
+
+logger = logging.getLogger(__name__)
+
+
+def count_pages(file_path: str) -> int:
+    """Return the number of pages in a PDF, rejecting encrypted files."""
+    with pymupdf.open(file_path, filetype="pdf") as doc:
+        if doc.needs_pass:
+            raise ValueError("PDF is encrypted. Please provide an unencrypted PDF.")
+        return doc.page_count
+
+
+def extract_page_range(file_path: str, start: int, stop: int) -> str:
+    """Extract text from pages [start, stop), skipping pages that fail."""
+    parts = []
+    with pymupdf.open(file_path, filetype="pdf") as doc:
+        for page_num in range(start, stop):
+            try:
+                parts.append(doc[page_num].get_text())
+            except Exception as e:
+                logger.warning(f"Could not extract text from page {page_num + 1}: {e}")
+    return "".join(parts)
+
+
+def warm_up():
+    """No-op task used to start a worker process ahead of the first upload."""
@@ -0,0 +1,99 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import numpy as np
+
+
+class QueryCache:
+    """Thread-safe LRU cache whose entries expire after a fixed TTL."""
+    
+    def __init__(self, max_size: int = 2000, ttl_seconds: float = 600):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.RLock()
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for key, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            
+            self._entries.move_to_end(key)
+            return value
+    
+    def put(self, key: Hashable, value: Any):
+        """Store value under key, evicting the least recently used entry if full."""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self):
+        """Drop every cached entry."""
+        with self._lock:
+            self._entries.clear()
+
+
+class SemanticCache:
+    """Fixed-size ring of past question embeddings and their answers."""
+    
+    def __init__(self, max_size: int = 500, threshold: float = 0.95):
+        self.max_size = max_size
+        self.threshold = threshold
+        self._matrix: Optional[np.ndarray] = None
+        self._top_ks = np.zeros(max_size, dtype=np.int64)
+        self._results: list = [None] * max_size
+        self._count = 0
+        self._next = 0
+        self._lock = threading.RLock()
+    
+    def get(self, embedding: np.ndarray, top_k: int) -> Optional[dict]:
+        """Return the answer of the most similar cached question above the threshold."""
+        vector = self._normalize(embedding)
+        with self._lock:
+            # put() rebuilds the matrix when the embedding size changes
+            if self._count == 0 or self._matrix.shape[1] != vector.shape[0]:
+                return None
+            
+            # Stored rows are unit length, so one product scores every entry
+            scores = self._matrix[:self._count] @ vector
+            scores[self._top_ks[:self._count] != top_k] = -np.inf
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                return self._results[best]
+            return None
+    
+    def put(self, embedding: np.ndarray, top_k: int, result: dict):
+        """Store an answer, evicting the oldest entry when full."""
+        vector = self._normalize(embedding)
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self._matrix = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+                self._count = self._next = 0
+            
+            slot = self._next
+            self._matrix[slot] = vector
+            self._top_ks[slot] = top_k
+            self._results[slot] = result
+            self._next = (slot + 1) % self.max_size
+            self._count = min(self._count + 1, self.max_size)
+    
+    def invalidate(self):
+        """Drop every cached entry."""
+        with self._lock:
+            self._results = [None] * self.max_size
+            self._count = self._next = 0
+    
+    def _normalize(self, embedding: np.ndarray) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
@@ -1,14 +1,24 @@
+import os
+import re
+import asyncio
+import hashlib
 import logging
-from typing import List
+from typing import AsyncIterator, Callable, List, Optional, Tuple
 
+import numpy as np
 import google.generativeai as genai
-from jinja2 import Template
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 
 from app.core.config import settings
 from app.repositories.document_repository import DocumentRepository
+from app.services.query_cache import QueryCache, SemanticCache
 
 logger = logging.getLogger(__name__)
 
+_PLACEHOLDER = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+NO_DOCUMENTS_ANSWER = "I don't have any documents to answer from. Please upload some PDFs first."
+
 
 class QueryService:
     """Business logic for querying documents."""
@@ -16,42 +26,169 @@ class QueryService:
     def __init__(self, repository: DocumentRepository):
         self.repository = repository
         self.model = genai.GenerativeModel(settings.MODEL_NAME)
-        self.prompt_template = self._load_prompt_template()
+        self.render_prompt = self._load_prompt_template()
+        
+        self._query_cache = QueryCache(
+            max_size=settings.QUERY_CACHE_SIZE,
+            ttl_seconds=settings.QUERY_CACHE_TTL_SECONDS
+        )
+        self._answer_cache = SemanticCache(
+            max_size=settings.ANSWER_CACHE_SIZE,
+            threshold=settings.ANSWER_CACHE_SIMILARITY
+        )
+        self._cache_revision = repository.revision
     
-    def query(self, question: str, top_k: int = 3) -> dict:
+    async def query(self, question: str, top_k: int = 3) -> dict:
         """Query documents and generate an answer."""
-        query_embedding = self.repository.get_embedding(question, task_type="retrieval_query")
+        cached, query_embedding, revision = await self._lookup_cached(question, top_k)
+        if cached is not None:
+            return {**cached, "question": question}
+        
+        sources, full_prompt = await self._build_prompt(question, query_embedding, top_k)
+        
+        if full_prompt is None:
+            return {
+                "question": question,
+                "answer": NO_DOCUMENTS_ANSWER,
+                "sources": []
+            }
+        
+        response = await self.model.generate_content_async(full_prompt)
+        
+        result = {
+            "question": question,
+            "answer": response.text,
+            "sources": sources
+        }
+        self._remember(query_embedding, top_k, result, revision)
+        return result
+    
+    async def stream_query(self, question: str, top_k: int = 3) -> AsyncIterator[dict]:
+        """Query documents, yielding a sources event and then answer text deltas."""
+        cached, query_embedding, revision = await self._lookup_cached(question, top_k)
+        if cached is not None:
+            yield {"type": "sources", "sources": cached["sources"]}
+            yield {"type": "delta", "text": cached["answer"]}
+            return
+        
+        sources, full_prompt = await self._build_prompt(question, query_embedding, top_k)
+        yield {"type": "sources", "sources": sources}
+        
+        if full_prompt is None:
+            yield {"type": "delta", "text": NO_DOCUMENTS_ANSWER}
+            return
+        
+        parts = []
+        response = await self.model.generate_content_async(full_prompt, stream=True)
+        async for chunk in response:
+            parts.append(chunk.text)
+            yield {"type": "delta", "text": chunk.text}
+        
+        result = {
+            "question": question,
+            "answer": "".join(parts),
+            "sources": sources
+        }
+        self._remember(query_embedding, top_k, result, revision)
+    
+    async def _lookup_cached(
+        self, question: str, top_k: int
+    ) -> Tuple[Optional[dict], Optional[np.ndarray], int]:
+        """Return (cached answer or None, question embedding, repository revision)."""
+        # The question is only embedded when the exact-match cache misses
+        self._check_cache_revision()
+        revision = self.repository.revision
         
-        results = self.repository.search(query_embedding, top_k)
+        cached = self._query_cache.get(self._query_key(question, top_k))
+        if cached is not None:
+            logger.debug("Query cache hit for question: %s", question)
+            return cached, None, revision
+        
+        query_embedding = np.asarray(
+            await self.repository.get_embedding_async(question, task_type="retrieval_query"),
+            dtype=np.float32
+        )
+        cached = self._answer_cache.get(query_embedding, top_k)
+        if cached is not None:
+            logger.debug("Semantic cache hit for question: %s", question)
+        return cached, query_embedding, revision
+    
+    def _remember(self, query_embedding: np.ndarray, top_k: int, result: dict, revision: int):
+        """Store a freshly generated answer in both answer caches."""
+        # A write that landed mid-query may already have been seen and the
+        # caches cleared; caching now would resurrect an answer built on
+        # the old document set.
+        if revision != self.repository.revision:
+            return
+        self._query_cache.put(self._query_key(result["question"], top_k), result)
+        self._answer_cache.put(query_embedding, top_k, result)
+    
+    def _query_key(self, question: str, top_k: int) -> str:
+        return hashlib.sha1(f"{question}|{top_k}".encode()).hexdigest()
+    
+    async def _build_prompt(
+        self, question: str, query_embedding: np.ndarray, top_k: int
+    ) -> Tuple[List[str], Optional[str]]:
+        """Retrieve relevant chunks and render the prompt; the prompt is None without context."""
+        results = await asyncio.to_thread(self.repository.search, query_embedding.tolist(), top_k)
         
         relevant_chunks = results['documents'][0] if results['documents'] else []
         sources = []
         if results['metadatas'] and results['metadatas'][0]:
-            sources = list(set([m['filename'] for m in results['metadatas'][0]]))
+            sources = list(dict.fromkeys(m['filename'] for m in results['metadatas'][0]))
         
         if not relevant_chunks:
-            return {
-                "question": question,
-                "answer": "I don't have any documents to answer from. Please upload some PDFs first.",
-                "sources": []
-            }
+            return [], None
         
         context = "\n\n---\n\n".join(relevant_chunks)
         
-        full_prompt = self.prompt_template.render(
+        full_prompt = self.render_prompt(
             context=context,
             question=question
         )
+        return sources, full_prompt
+    
+    def _check_cache_revision(self):
+        """Drop cached answers once the document set has changed."""
+        if self._cache_revision != self.repository.revision:
+            self._query_cache.invalidate()
+            self._answer_cache.invalidate()
+            self._cache_revision = self.repository.revision
+    
+    def _load_prompt_template(self) -> Callable[..., str]:
+        """Load the prompt template from file and return its render function."""
+        with open(settings.PROMPT_TEMPLATE_PATH, 'r', encoding='utf-8') as f:
+            source = f.read()
         
-        response = self.model.generate_content(full_prompt)
+        # Templates that only substitute plain {{ variables }} are split once
+        # into literal text and names and rendered with a single join; any
+        # other Jinja syntax falls back to Jinja.
+        parts = _PLACEHOLDER.split(source)
+        literals, names = parts[::2], parts[1::2]
+        if any(marker in literal for literal in literals for marker in ("{{", "{%", "{#")):
+            return self._load_jinja_template().render
         
-        return {
-            "question": question,
-            "answer": response.text,
-            "sources": sources
-        }
+        # Jinja drops a single trailing newline by default; match it.
+        if literals[-1].endswith("\n"):
+            literals[-1] = literals[-1][:-1]
+        head = literals[0]
+        fields = tuple(zip(names, literals[1:]))
+        
+        def render(**values) -> str:
+            # Undefined names render empty, as they do in Jinja
+            parts = [head]
+            for name, literal in fields:
+                parts += (str(values.get(name, "")), literal)
+            return "".join(parts)
+        
+        return render
     
-    def _load_prompt_template(self) -> Template:
-        """Load the prompt template from file."""
-        with open(settings.PROMPT_TEMPLATE_PATH, 'r', encoding='utf-8') as f:
-            return Template(f.read())
+    def _load_jinja_template(self):
+        """Load the prompt through a Jinja environment that caches compiled bytecode on disk."""
+        os.makedirs(settings.JINJA_CACHE_DIR, exist_ok=True)
+        env = Environment(
+            loader=FileSystemLoader(os.path.dirname(settings.PROMPT_TEMPLATE_PATH) or "."),
+            bytecode_cache=FileSystemBytecodeCache(settings.JINJA_CACHE_DIR),
+            autoescape=False
+        )
+        return env.get_template(os.path.basename(settings.PROMPT_TEMPLATE_PATH))